@@ -0,0 +1,38 @@
+"""add health history index
+
+Revision ID: 9915ba44f9ae
+Revises: 4a0fd7ca68ff
+Create Date: 2026-10-18 12:10:41.118243
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9915ba44f9ae'
+down_revision: Union[str, Sequence[str], None] = '4a0fd7ca68ff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        # get_last_health_by_kp_for_users: WHERE user_id, kp ORDER BY id DESC — index-only scan
+        op.create_index(
+            'ix_health_user_id_kp_id', 'health', ['user_id', 'kp', 'id'],
+            postgresql_include=['health'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_health_user_id_kp_id', table_name='health',
+                      postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,29 @@
+"""add profiles.active
+
+Revision ID: e71f0a9c3b26
+Revises: c384d3010504
+Create Date: 2026-10-18 17:24:05.902317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e71f0a9c3b26'
+down_revision: Union[str, Sequence[str], None] = 'c384d3010504'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # константный DEFAULT: в PostgreSQL 11+ столбец добавляется без перезаписи таблицы
+    op.add_column('profiles', sa.Column('active', sa.Boolean(), server_default=sa.text('true'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('profiles', 'active')
@@ -1,2 +1,3 @@
 from .celery import celery
 import celery_app.tasks
+import celery_app.worker
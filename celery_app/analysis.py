@@ -13,7 +13,6 @@ async def analysis(last):
             res += 2
     try:
         result = round(res / count)
-        print(result)
     except ZeroDivisionError:
         return None
 
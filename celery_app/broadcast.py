@@ -0,0 +1,348 @@
+import asyncio
+import collections.abc
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union
+
+import aiohttp
+from redis.asyncio import Redis
+
+from core.http_client import http_client
+from core.metrics import BROADCAST_MESSAGES, TELEGRAM_FLOOD_WAITS, TELEGRAM_SEND
+from core.settings import settings
+
+
+# тело sendMessage: dict или уже сериализованный JSON (см. celery_app.payloads)
+Message = Tuple[int, Union[dict, bytes]]
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# описания ответа 400, после которых писать в чат бессмысленно
+UNREACHABLE_DESCRIPTIONS = ("chat not found", "peer_id_invalid", "user not found")
+
+
+@dataclass
+class BroadcastReport:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    not_found: int = 0
+    server_errors: int = 0
+    retries: int = 0
+    flood_waits: int = 0
+    deactivated: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    duration: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "not_found": self.not_found,
+            "server_errors": self.server_errors,
+            "retries": self.retries,
+            "flood_waits": self.flood_waits,
+            "deactivated": self.deactivated,
+            "duration": self.duration,
+        }
+
+    @classmethod
+    def merge(cls, reports: Iterable[dict], duration: float) -> "BroadcastReport":
+        """Сводный отчёт по частям рассылки, выполненным разными воркерами."""
+        merged = cls(duration=duration)
+        for report in reports:
+            for name in ("total", "sent", "failed", "blocked", "not_found", "server_errors",
+                         "retries", "flood_waits", "deactivated"):
+                setattr(merged, name, getattr(merged, name) + report.get(name, 0))
+        return merged
+
+    def __str__(self):
+        rate = self.sent / self.duration if self.duration else 0.0
+        return (f"📬 Рассылка: всего {self.total}, доставлено {self.sent}, "
+                f"заблокировали {self.blocked}, чат не найден {self.not_found}, "
+                f"ошибок {self.failed}, 5xx: {self.server_errors}, "
+                f"повторов {self.retries}, 429: {self.flood_waits}, "
+                f"отключено {self.deactivated}, "
+                f"{self.duration:.1f} с ({rate:.1f} сообщ./с)")
+
+
+class TokenBucket:
+    """Глобальный лимит отправки: rate токенов в секунду, запас до capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def pause(self, seconds: float):
+        # Telegram вернул 429 — притормаживаем всех отправителей
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RedisTokenBucket:
+    """
+    Тот же token bucket, но общий для всех процессов-воркеров: состояние
+    лежит в хеше Redis и меняется Lua-скриптом атомарно, поэтому сколько бы
+    частей рассылки ни шло одновременно, вместе они не превышают rate, а
+    одна часть получает его целиком. Пауза после 429 тоже общая.
+    """
+
+    ACQUIRE = """
+    local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'paused_until')
+    local paused_until = tonumber(state[3]) or 0
+    if now < paused_until then
+        return tostring(paused_until - now)
+    end
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        wait = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], 60)
+    return tostring(wait)
+    """
+
+    PAUSE = """
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+    local paused_until = now + tonumber(ARGV[1])
+    if paused_until > (tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0) then
+        redis.call('HSET', KEYS[1], 'paused_until', tostring(paused_until), 'tokens', '0', 'updated', tostring(now))
+    end
+    redis.call('EXPIRE', KEYS[1], 60 + math.ceil(tonumber(ARGV[1])))
+    """
+
+    def __init__(self, redis: Redis, key: str, rate: float, capacity: float):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._acquire = redis.register_script(self.ACQUIRE)
+        self._pause = redis.register_script(self.PAUSE)
+
+    async def pause(self, seconds: float):
+        await self._pause(keys=[self.key], args=[seconds])
+
+    async def acquire(self):
+        while True:
+            wait = float(await self._acquire(keys=[self.key], args=[self.rate, self.capacity]))
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class Broadcaster:
+    """
+    Асинхронная рассылка через Bot API: пул из workers отправителей,
+    общий token bucket (~30 сообщений/с; bucket передают, когда лимит делят
+    несколько процессов), не чаще одного сообщения в секунду в один чат, учёт retry_after из 429 и повторы при сетевых ошибках и 5xx.
+
+    Получатели, до которых доставка невозможна (403, 400 chat not found),
+    копятся и пачками по deactivate_batch передаются в on_unreachable.
+    Окончательный исход каждого сообщения (sent, blocked, not_found,
+    failed) сообщается в on_result — по нему ведётся чекпоинт рассылки.
+    """
+
+    def __init__(
+            self,
+            token: str,
+            campaign: str = "broadcast",
+            rate: float = settings.BROADCAST_RATE,
+            bucket: Optional[Union[TokenBucket, RedisTokenBucket]] = None,
+            workers: int = settings.BROADCAST_WORKERS,
+            max_retries: int = settings.BROADCAST_MAX_RETRIES,
+            per_chat_interval: float = 1.0,
+            on_unreachable: Optional[Callable[[list[int]], Awaitable[int]]] = None,
+            deactivate_batch: int = settings.BROADCAST_BATCH_SIZE,
+            on_result: Optional[Callable[[int, str], Awaitable[None]]] = None,
+    ):
+        self.url = f"{settings.TELEGRAM_API_URL}/bot{token}/sendMessage"
+        self.campaign = campaign
+        self.bucket = bucket or TokenBucket(rate, capacity=rate)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.per_chat_interval = per_chat_interval
+        self._last_sent: Dict[int, float] = {}
+        self.on_unreachable = on_unreachable
+        self.deactivate_batch = deactivate_batch
+        self._unreachable: list[int] = []
+        self.on_result = on_result
+
+    async def run(self, messages: Union[Iterable[Message], AsyncIterable[Message]]) -> BroadcastReport:
+        report = BroadcastReport()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        session = await http_client.session()
+
+        senders = [
+            asyncio.create_task(self._worker(session, queue, report))
+            for _ in range(self.workers)
+        ]
+        try:
+            if isinstance(messages, collections.abc.AsyncIterable):
+                async for message in messages:
+                    await self._put(queue, message, senders)
+            else:
+                for message in messages:
+                    await self._put(queue, message, senders)
+            for _ in senders:
+                await self._put(queue, None, senders)
+            await asyncio.gather(*senders)
+            await self._flush_unreachable(report)
+        finally:
+            for sender in senders:
+                sender.cancel()
+
+        report.duration = time.monotonic() - report.started_at
+        return report
+
+    @staticmethod
+    async def _put(queue: asyncio.Queue, message: Optional[Message], senders: list[asyncio.Task]):
+        if not queue.full():
+            queue.put_nowait(message)
+            return
+        # очередь полна: ждём места, но не дольше, чем живы отправители
+        put = asyncio.ensure_future(queue.put(message))
+        done, _ = await asyncio.wait([put, *senders], return_when=asyncio.FIRST_COMPLETED)
+        if put in done:
+            return
+        put.cancel()
+        # до стоп-сигнала отправитель может завершиться, только упав
+        for sender in done:
+            sender.result()
+        raise RuntimeError("Отправитель рассылки завершился раньше времени")
+
+    async def _worker(self, session: aiohttp.ClientSession, queue: asyncio.Queue, report: BroadcastReport):
+        while True:
+            message = await queue.get()
+            if message is None:
+                return
+            report.total += 1
+            chat_id, payload = message
+            try:
+                outcome = await self._deliver(session, chat_id, payload, report)
+            except Exception as ex:
+                print(f"❌ Не удалось отправить в TG ({chat_id}): {type(ex).__name__}: {ex}")
+                report.failed += 1
+                BROADCAST_MESSAGES.labels(self.campaign, "failed").inc()
+                outcome = "failed"
+            if self.on_result is not None:
+                try:
+                    await self.on_result(chat_id, outcome)
+                except Exception as ex:
+                    print(f"⚠️ on_result для {chat_id} не выполнен: {type(ex).__name__}: {ex}")
+
+    async def _mark_unreachable(self, chat_id: int, report: BroadcastReport):
+        if self.on_unreachable is None:
+            return
+        self._unreachable.append(chat_id)
+        if len(self._unreachable) >= self.deactivate_batch:
+            await self._flush_unreachable(report)
+
+    async def _flush_unreachable(self, report: BroadcastReport):
+        chat_ids, self._unreachable = self._unreachable, []
+        if not chat_ids or self.on_unreachable is None:
+            return
+        try:
+            report.deactivated += await self.on_unreachable(chat_ids)
+        except Exception as ex:
+            # не повод останавливать рассылку: пользователи отключатся в следующий раз
+            print(f"❌ Не удалось отключить недоступных получателей: {ex}")
+
+    async def _wait_chat(self, chat_id: int):
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_sent[chat_id] = time.monotonic()
+
+    async def _deliver(
+            self,
+            session: aiohttp.ClientSession,
+            chat_id: int,
+            payload: Union[dict, bytes],
+            report: BroadcastReport,
+    ) -> str:
+        if isinstance(payload, bytes):
+            request = {"data": payload, "headers": JSON_HEADERS}
+        else:
+            request = {"json": payload}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                report.retries += 1
+            await self._wait_chat(chat_id)
+            await self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                async with session.post(self.url, **request) as response:
+                    status = response.status
+                    body = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as ex:
+                print(f"❌ Не удалось отправить в TG ({chat_id}): {ex}")
+                await asyncio.sleep(2 ** attempt)
+                continue
+            finally:
+                TELEGRAM_SEND.labels(self.campaign).observe(time.perf_counter() - started)
+
+            if status == 200:
+                report.sent += 1
+                BROADCAST_MESSAGES.labels(self.campaign, "sent").inc()
+                return "sent"
+            if status == 429:
+                report.flood_waits += 1
+                TELEGRAM_FLOOD_WAITS.labels(self.campaign).inc()
+                retry_after = (body or {}).get("parameters", {}).get("retry_after", 1)
+                await self.bucket.pause(retry_after)
+                continue
+            if status == 403:
+                report.blocked += 1
+                BROADCAST_MESSAGES.labels(self.campaign, "blocked").inc()
+                await self._mark_unreachable(chat_id, report)
+                return "blocked"
+            description = str((body or {}).get("description", ""))
+            if status == 400 and any(text in description.lower() for text in UNREACHABLE_DESCRIPTIONS):
+                report.not_found += 1
+                BROADCAST_MESSAGES.labels(self.campaign, "not_found").inc()
+                await self._mark_unreachable(chat_id, report)
+                return "not_found"
+            if status >= 500:
+                report.server_errors += 1
+                await asyncio.sleep(2 ** attempt)
+                continue
+
+            print(f"❌ Не удалось отправить в TG ({chat_id}): {status} {description}")
+            report.failed += 1
+            BROADCAST_MESSAGES.labels(self.campaign, "failed").inc()
+            return "failed"
+
+        report.failed += 1
+        BROADCAST_MESSAGES.labels(self.campaign, "failed").inc()
+        return "failed"
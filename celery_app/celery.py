@@ -28,7 +28,15 @@ celery.conf.update(
             'task': 'celery_app.tasks.query_user',
             'schedule': crontab(hour="20", minute='0'),
         },
+        'kp_daily': {
+            'task': 'celery_app.tasks.refresh_kp_daily',
+            'schedule': crontab(minute='*/30'),
+        },
     },
+    # части рассылки откладываются на всё окно доставки; без этого Redis
+    # вернул бы в очередь задачи с countdown больше часа. Части, которые держал
+    # погибший воркер, он же ставит заново при старте, не дожидаясь этого срока
+    broker_transport_options={"visibility_timeout": 6 * 3600},
     timezone="Europe/Minsk",
     enable_utc=False,
     include=["celery_app.tasks"],
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from redis.asyncio import Redis
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError
+
+from core.database.requests import Recipient
+from core.settings import settings
+
+
+_redis: Optional[Redis] = None
+
+# блокировка части продлевается, пока часть идёт; после гибели процесса она истекает
+LOCK_TIMEOUT = 60
+
+
+def client() -> Redis:
+    """Redis процесса-воркера: чекпоинты и общий лимит отправки рассылок."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.REDIS_URL)
+    return _redis
+
+
+async def close():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+async def plan(campaign: str, task: str, chunks: list[tuple[int, list, float]]):
+    """
+    Запоминает части кампании (start, аргументы задачи, задержка старта),
+    чтобы recoverable() нашёл незавершённые после гибели воркера.
+    """
+    key = f"broadcast:{campaign}:plan"
+    now = time.time()
+    entries = {
+        str(start): json.dumps({"task": task, "args": args, "eta": now + countdown})
+        for start, args, countdown in chunks
+    }
+    async with client().pipeline(transaction=True) as pipe:
+        pipe.hset(key, mapping=entries)
+        pipe.expire(key, int(max(countdown for _, _, countdown in chunks)) + settings.BROADCAST_RECOVERY_TTL)
+        await pipe.execute()
+
+
+async def recoverable() -> list[dict]:
+    """Запланированные части без итогового отчёта: {"task", "args", "eta"}."""
+    redis = client()
+    chunks = []
+    async for key in redis.scan_iter(match="broadcast:*:plan"):
+        campaign = key.decode()[len("broadcast:"):-len(":plan")]
+        entries = await redis.hgetall(key)
+        if not entries:
+            continue
+        starts = list(entries)
+        reports = await redis.mget([f"broadcast:{campaign}:{start.decode()}:report" for start in starts])
+        chunks += [json.loads(entries[start]) for start, report in zip(starts, reports) if report is None]
+    return chunks
+
+
+class BroadcastCheckpoint:
+    """
+    Прогресс одной части рассылки в Redis, чтобы повторный запуск части
+    после падения воркера продолжил работу, а не начал заново.
+
+    - cursor — users.id, до которого (включительно) все сообщения части
+      получили окончательный результат; повторный запуск читает получателей
+      с cursor + 1;
+    - delivered — общее на кампанию множество чатов, которым сообщение
+      доставлено (или писать им бессмысленно), их пропускают даже при
+      пересчёте границ частей;
+    - report — итог завершённой части, повторный запуск просто его возвращает;
+    - lock — копии одной части (повторная доставка брокером, восстановление
+      после рестарта воркера) выполняются по очереди, а не одновременно.
+    """
+
+    def __init__(self, campaign: str, chunk: str, ttl: int = settings.BROADCAST_CHECKPOINT_TTL):
+        self.delivered_key = f"broadcast:{campaign}:delivered"
+        self.cursor_key = f"broadcast:{campaign}:{chunk}:cursor"
+        self.report_key = f"broadcast:{campaign}:{chunk}:report"
+        self.lock_key = f"broadcast:{campaign}:{chunk}:lock"
+        self.ttl = ttl
+        # пачки в порядке users.id: [последний users.id, чаты без результата]
+        self._batches: deque = deque()
+        self._batch_of: dict[int, list] = {}
+
+    @asynccontextmanager
+    async def running(self):
+        """Ждёт, пока другая копия части закончит, и держит блокировку до выхода."""
+        lock = client().lock(self.lock_key, timeout=LOCK_TIMEOUT, sleep=1.0)
+        await lock.acquire()
+        hold = asyncio.create_task(self._hold(lock))
+        try:
+            yield
+        finally:
+            hold.cancel()
+            try:
+                await lock.release()
+            except LockError:
+                pass
+
+    @staticmethod
+    async def _hold(lock: Lock):
+        while True:
+            await asyncio.sleep(LOCK_TIMEOUT / 3)
+            try:
+                await lock.reacquire()
+            except LockError as ex:
+                print(f"⚠️ Блокировка части рассылки потеряна: {ex}")
+                return
+
+    async def report(self) -> Optional[dict]:
+        raw = await client().get(self.report_key)
+        return json.loads(raw) if raw is not None else None
+
+    async def cursor(self) -> Optional[int]:
+        raw = await client().get(self.cursor_key)
+        return int(raw) if raw is not None else None
+
+    async def pending(self, recipients: AsyncIterable[list[Recipient]]) -> AsyncIterator[list[int]]:
+        """Пачки user_tg_id без уже доставленных чатов; пачки запоминаются для курсора."""
+        redis = client()
+        async for rows in recipients:
+            if not rows:
+                continue
+            chat_ids = [user_tg_id for _, user_tg_id in rows]
+            delivered = await redis.smismember(self.delivered_key, chat_ids)
+            pending = [chat_id for chat_id, done in zip(chat_ids, delivered) if not done]
+
+            batch = [rows[-1][0], set(pending)]
+            self._batches.append(batch)
+            for chat_id in pending:
+                self._batch_of[chat_id] = batch
+            await self._advance()
+            if pending:
+                yield pending
+
+    async def finished(self, chat_id: int, outcome: str):
+        """Колбэк Broadcaster.on_result."""
+        if outcome != "failed":
+            async with client().pipeline(transaction=False) as pipe:
+                pipe.sadd(self.delivered_key, chat_id)
+                pipe.expire(self.delivered_key, self.ttl)
+                await pipe.execute()
+        batch = self._batch_of.pop(chat_id, None)
+        if batch is not None:
+            batch[1].discard(chat_id)
+            await self._advance()
+
+    async def complete(self, report: dict):
+        await client().set(self.report_key, json.dumps(report), ex=self.ttl)
+
+    async def _advance(self):
+        cursor = None
+        while self._batches and not self._batches[0][1]:
+            cursor = self._batches.popleft()[0]
+        if cursor is not None:
+            await client().set(self.cursor_key, cursor, ex=self.ttl)
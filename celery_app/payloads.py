@@ -0,0 +1,95 @@
+from functools import lru_cache
+from typing import Optional
+
+import orjson
+
+
+NOTIFICATION_MARKUP = {
+    "inline_keyboard": [
+        [
+            {"text": "⚙️ Настройки", "callback_data": "settings"},
+        ],
+        [
+            {"text": "🔮 Прогноз на завтра", "callback_data": "predict_weather"}
+        ],
+        [
+            {"text": "📊 Прогноз на сегодня", "callback_data": "now_weather"}
+        ]
+    ]
+}
+
+QUERY_MARKUP = {
+    "inline_keyboard": [
+        [
+            {"text": "😣 плохо", "callback_data": "query bad"},
+        ],
+        [
+            {"text": "😑 приемлемо", "callback_data": "query normal"},
+        ],
+        [
+            {"text": "😀 хорошо", "callback_data": "query good"},
+        ]
+    ]
+}
+
+# (kp меньше которого действует описание, обстановка, самочувствие); None — всё, что выше
+KP_LEVELS = (
+    (4, "спокойная геомагнитная обстановка",
+     "🔹 <b>Самочувствие:</b> большинство людей чувствуют себя хорошо. Редко отмечаются жалобы."),
+    (5, "неустойчивая геомагнитная обстановка",
+     "🔸 <b>Самочувствие:</b> возможны лёгкие недомогания у метеочувствительных людей: головная боль, усталость, перепады настроения."),
+    (6, "слабая геомагнитная буря",
+     "⚠️ <b>Самочувствие:</b> у метеозависимых — повышенная утомляемость, головокружение, скачки давления. Рекомендуется избегать стрессов и физических нагрузок."),
+    (7, "умеренная геомагнитная буря",
+     "❗ <b>Самочувствие:</b> значительное ухудшение самочувствия у чувствительных людей. Возможны боли в суставах, сердцебиение, нарушение сна. Следите за состоянием здоровья."),
+    (8, "сильная геомагнитная буря",
+     "❗❗ <b>Самочувствие:</b> высокий риск ухудшения: головные боли, давление, сердечные приступы у предрасположенных. Рекомендуется придерживаться режима, избегать алкоголя и кофе."),
+    (9, "очень сильная геомагнитная буря",
+     "❌ <b>Самочувствие:</b> возможны серьёзные симптомы даже у здоровых людей. Людям с хроническими заболеваниями — особенно осторожно. Обратите внимание на своё состояние."),
+    (None, "экстремальная геомагнитная буря",
+     "🆘 <b>Самочувствие:</b> высокий риск серьёзных нарушений самочувствия. Возможны обострения хронических заболеваний, скачки давления, головокружение. Следите за здоровьем, при необходимости — обратитесь к врачу."),
+)
+
+
+def notification_text(kp: int) -> str:
+    for bound, situation, health in KP_LEVELS:
+        if bound is None or kp < bound:
+            return (
+                f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — {situation}.\n\n"
+                f"{health}\n"
+                "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
+            )
+
+
+class PayloadTemplate:
+    """
+    Тело sendMessage, заранее сериализованное orjson.
+
+    От получателя к получателю меняются только chat_id и необязательное
+    дополнение к тексту, поэтому остальное собирается в байты один раз,
+    а render только склеивает готовые куски. Экранированные дополнения
+    кэшируются: их всего несколько вариантов.
+    """
+
+    __slots__ = ("_text", "_tail", "_appendices")
+
+    def __init__(self, text: str, **fields):
+        # текст без закрывающей кавычки: дополнение дописывается внутрь строки
+        self._text = orjson.dumps(text)[:-1]
+        self._tail = b'",' + orjson.dumps(fields)[1:] if fields else b'"}'
+        self._appendices = {"": b""}
+
+    def render(self, chat_id: int, appendix: Optional[str] = None) -> bytes:
+        appendix = appendix or ""
+        extra = self._appendices.get(appendix)
+        if extra is None:
+            extra = self._appendices[appendix] = orjson.dumps(appendix)[1:-1]
+        return b"".join((b'{"chat_id":', b"%d" % chat_id, b',"text":', self._text, extra, self._tail))
+
+
+@lru_cache(maxsize=None)
+def notification_template(kp: int) -> PayloadTemplate:
+    return PayloadTemplate(notification_text(kp), parse_mode="HTML", reply_markup=NOTIFICATION_MARKUP)
+
+
+QUERY_TEMPLATE = PayloadTemplate("❓Оцените ваше самочувствие", parse_mode="Markdown", reply_markup=QUERY_MARKUP)
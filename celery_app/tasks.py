@@ -1,154 +1,227 @@
-import asyncio
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Optional
+from zoneinfo import ZoneInfo
+
+from celery import chord
 
 from celery_app.celery import celery
 import core.database.requests as rq
-import requests
 
 from core.settings import settings
-import core.handlers.texts as txt
+from core.forecast.cache import forecast_cache
 
 from celery_app.analysis import analysis
-
-import nest_asyncio
+from celery_app import checkpoint
+from celery_app.broadcast import Broadcaster, BroadcastReport, RedisTokenBucket
+from celery_app.checkpoint import BroadcastCheckpoint
+from celery_app.payloads import QUERY_TEMPLATE, notification_template
+from celery_app.worker import run
 
 
 BOT_TOKEN = settings.BOT_TOKEN
 
-
-def send_notif(ids: list[int], kp: int):
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        nest_asyncio.apply()
+OnResult = Optional[Callable[[int, str], Awaitable[None]]]
+
+
+def _bucket() -> RedisTokenBucket:
+    # части рассылки идут параллельно в разных процессах и делят лимит Telegram на бота
+    return RedisTokenBucket(
+        checkpoint.client(), f"broadcast:rate:{BOT_TOKEN.split(':')[0]}",
+        settings.BROADCAST_RATE, capacity=settings.BROADCAST_RATE,
+    )
+
+
+def _delivery_slots() -> int:
+    """Число слотов окна DELIVERY_WINDOW_MINUTES, по которым поровну делятся получатели."""
+    if settings.DELIVERY_WINDOW_MINUTES <= 0:
+        return 1
+    return max(1, settings.DELIVERY_SLOTS)
+
+
+def _countdown(slot: int) -> float:
+    return slot * settings.DELIVERY_WINDOW_MINUTES * 60 / _delivery_slots()
+
+
+async def _run_chunk(
+        campaign: str,
+        start: int,
+        recipients: Callable[[int], AsyncIterator[list[rq.Recipient]]],
+        send: Callable[[AsyncIterable[list[int]], OnResult], Awaitable[Optional[BroadcastReport]]],
+) -> dict:
+    """Часть рассылки с чекпоинтом: повторный запуск продолжает с курсора и пропускает доставленные чаты."""
+    chunk = BroadcastCheckpoint(campaign, str(start))
+    async with chunk.running():
+        report = await chunk.report()
+        if report is not None:
+            return report
+
+        cursor = await chunk.cursor()
+        if cursor is not None:
+            print(f"↩️ [{campaign}] часть {start}: продолжаем после users.id {cursor}")
+        batches = chunk.pending(recipients(start if cursor is None else cursor + 1))
+        report = await send(batches, chunk.finished)
+        if report is None:
+            return {}
+        await chunk.complete(report.as_dict())
+        return report.as_dict()
+
+
+async def _dispatch(name: str, campaign: str, task, chunks: list[tuple[int, list, int]]):
+    """
+    Chord из частей рассылки (start, аргументы задачи, слот), каждая стартует
+    в начале своего слота окна доставки. План частей сохраняется в Redis:
+    если воркер погибнет вместе с отложенными частями, при старте он поставит
+    их заново (см. celery_app.worker).
+    """
+    planned = [(start, args, _countdown(slot)) for start, args, slot in chunks]
+    await checkpoint.plan(campaign, task.name, planned)
+    chord(
+        task.s(*args).set(countdown=countdown)
+        for _, args, countdown in planned
+    )(broadcast_summary.s(name, time.time()))
+
+
+async def send_notif(batches: AsyncIterable[list[int]], kp: int, on_result: OnResult = None):
     if not BOT_TOKEN:
         print("⚠️ Telegram bot token или chat ID не заданы")
         return
-    if kp < 4:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — спокойная геомагнитная обстановка.\n\n"
-            "🔹 <b>Самочувствие:</b> большинство людей чувствуют себя хорошо. Редко отмечаются жалобы.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-    elif kp < 5:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — неустойчивая геомагнитная обстановка.\n\n"
-            "🔸 <b>Самочувствие:</b> возможны лёгкие недомогания у метеочувствительных людей: головная боль, усталость, перепады настроения.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-    elif kp < 6:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — слабая геомагнитная буря.\n\n"
-            "⚠️ <b>Самочувствие:</b> у метеозависимых — повышенная утомляемость, головокружение, скачки давления. Рекомендуется избегать стрессов и физических нагрузок.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-    elif kp < 7:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — умеренная геомагнитная буря.\n\n"
-            "❗ <b>Самочувствие:</b> значительное ухудшение самочувствия у чувствительных людей. Возможны боли в суставах, сердцебиение, нарушение сна. Следите за состоянием здоровья.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-    elif kp < 8:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — сильная геомагнитная буря.\n\n"
-            "❗❗ <b>Самочувствие:</b> высокий риск ухудшения: головные боли, давление, сердечные приступы у предрасположенных. Рекомендуется придерживаться режима, избегать алкоголя и кофе.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-    elif kp < 9:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — очень сильная геомагнитная буря.\n\n"
-            "❌ <b>Самочувствие:</b> возможны серьёзные симптомы даже у здоровых людей. Людям с хроническими заболеваниями — особенно осторожно. Обратите внимание на своё состояние.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-    else:
-        desc = (
-            f"Сегодня максимальный Kp-индекс будет <b>{kp}</b> — экстремальная геомагнитная буря.\n\n"
-            "🆘 <b>Самочувствие:</b> высокий риск серьёзных нарушений самочувствия. Возможны обострения хронических заболеваний, скачки давления, головокружение. Следите за здоровьем, при необходимости — обратитесь к врачу.\n"
-            "Узнать больше можно по кнопке '📊 Прогноз на сегодня'."
-        )
-
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    for user_id in ids:
-        last = loop.run_until_complete(rq.get_last_health_by_kp_for_user(user_id, kp))
-        if last is not None:
-            health = loop.run_until_complete(analysis(last))
-        else:
-            health = None
-        payload = {
-            "chat_id": user_id,
-            "text": desc + (health or ""),
-            "parse_mode": "HTML",
-            "reply_markup":  {
-                "inline_keyboard": [
-                    [
-                        {"text": "⚙️ Настройки", "callback_data": "settings"},
-                    ],
-                    [
-                        {"text": "🔮 Прогноз на завтра", "callback_data": "predict_weather"}
-                    ],
-                    [
-                        {"text": "📊 Прогноз на сегодня", "callback_data": "now_weather"}
-                    ]
-                ]
-            }
-        }
-        try:
-            requests.post(url, json=payload, timeout=5)
-        except Exception as ex:
-            print(f"❌ Не удалось отправить в TG: {ex}")
-
-
-def send_query(ids: list):
+    template = notification_template(kp)
+
+    async def messages():
+        async for batch in batches:
+            history = await rq.get_last_health_by_kp_for_users(batch, kp)
+            for user_id in batch:
+                health = await analysis(history.get(user_id, []))
+                yield user_id, template.render(user_id, health)
+
+    broadcaster = Broadcaster(
+        BOT_TOKEN, "notification", bucket=_bucket(),
+        on_unreachable=rq.deactivate_users, on_result=on_result,
+    )
+    report = await broadcaster.run(messages())
+    print(report)
+    return report
+
+
+async def send_query(batches: AsyncIterable[list[int]], on_result: OnResult = None):
     if not BOT_TOKEN :
         print("⚠️ Telegram bot token или chat ID не заданы")
         return
-    print("TRY")
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    for i in ids:
-        payload = {
-            "chat_id": i,
-            "text": f"❓Оцените ваше самочувствие",
-            "parse_mode": "Markdown",
-            "reply_markup": {
-                "inline_keyboard": [
-                    [
-                        {"text": "😣 плохо", "callback_data": "query bad"},
-                    ],
-                    [
-                        {"text": "😑 приемлемо", "callback_data": "query normal"},
-                    ],
-                    [
-                        {"text": "😀 хорошо", "callback_data": "query good"},
-                    ]
-                ]
-            }
-        }
-        try:
-            requests.post(url, json=payload, timeout=5)
-        except Exception as ex:
-            print(f"❌ Не удалось отправить в TG: {ex}")
+
+    async def messages():
+        async for batch in batches:
+            for i in batch:
+                yield i, QUERY_TEMPLATE.render(i)
+
+    broadcaster = Broadcaster(
+        BOT_TOKEN, "query", bucket=_bucket(),
+        on_unreachable=rq.deactivate_users, on_result=on_result,
+    )
+    report = await broadcaster.run(messages())
+    print(report)
+    return report
+
+async def _refresh_kp_daily() -> dict:
+    series = await forecast_cache.series()
+    # наблюдённые значения уже не меняются — берём только то, что после них
+    since = await rq.get_last_observed_time()
+    slots = series.slots(since)
+    changed = await rq.upsert_kp_observations(slots)
+    print(f"🧲 Kp: обновлено слотов — {changed}")
+    if not slots:
+        return {}
+    # kp_daily — производная от kp_observations: пересчитываем затронутые дни
+    first_day = slots[0][0].replace(hour=0, minute=0, second=0, microsecond=0)
+    return await rq.rebuild_kp_daily(first_day)
+
 
 @celery.task
-def send_notification():
+def refresh_kp_daily():
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            nest_asyncio.apply()
+        run(_refresh_kp_daily())
+    except Exception as e:
+        print(f"❌ Не удалось обновить Kp: {type(e).__name__}: {e}")
+
+
+async def _send_notification():
+    # повторный запуск за тот же день — та же кампания: доставленные пропускаются
+    campaign = f"notification:{datetime.now(ZoneInfo(celery.conf.timezone)):%Y-%m-%d}"
+    today = datetime.now(timezone.utc).date()
+    kp = await rq.get_max_kp_for_date(today)
+    if kp is None:
+        kp = (await _refresh_kp_daily()).get(today)
+    if kp is None:
+        print("⚠️ Прогноз на сегодня пока не опубликован")
+        return
 
-        kp = loop.run_until_complete(txt.get_kp_forecast_report(only_max=True))
+    chunks = await rq.get_chunks_for_kp(kp, settings.BROADCAST_CHUNK_SIZE, _delivery_slots())
+    if not chunks:
+        return
+    await _dispatch("notification", campaign, send_notification_chunk, [
+        (start, [campaign, kp, start, end], slot) for start, end, slot in chunks
+    ])
 
-        users_ids = loop.run_until_complete(rq.get_user_ids_for_kp(kp))
 
-        send_notif(users_ids, kp)
+@celery.task
+def send_notification():
+    try:
+        run(_send_notification())
     except Exception as e:
         error_msg = f"{type(e).__name__}: {e}"
         print(f"❌ Ошибка: {error_msg}")
 
 
+# части продолжаются с чекпоинта, кто бы их ни перезапустил:
+# - погиб дочерний процесс — брокер сразу выдаёт часть заново (acks_late + reject_on_worker_lost);
+# - погиб весь воркер — при старте он ставит часть заново по плану кампании (celery_app.worker);
+# - часть упала с ошибкой (БД, Redis, сеть) — повтор с экспоненциальной задержкой
+CHUNK_TASK = dict(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=5,
+)
+
+
+@celery.task(**CHUNK_TASK)
+def send_notification_chunk(campaign: str, kp: int, start: int, end: Optional[int]):
+    return run(_run_chunk(
+        campaign,
+        start,
+        lambda resume: rq.iter_recipients_for_kp(kp, (resume, end)),
+        lambda batches, on_result: send_notif(batches, kp, on_result),
+    ))
+
+
+async def _query_user():
+    campaign = f"query:{datetime.now(ZoneInfo(celery.conf.timezone)):%Y-%m-%d}"
+    chunks = await rq.get_chunks_for_query(settings.BROADCAST_CHUNK_SIZE, _delivery_slots())
+    if not chunks:
+        return
+    await _dispatch("query", campaign, query_user_chunk, [
+        (start, [campaign, start, end], slot) for start, end, slot in chunks
+    ])
 
 
 @celery.task
 def query_user():
-    loop = asyncio.get_event_loop()
-    if loop.is_running():
-        nest_asyncio.apply()
-    ids = loop.run_until_complete(rq.get_user_ids_for_query())
-    send_query(ids)
+    run(_query_user())
+
+
+@celery.task(**CHUNK_TASK)
+def query_user_chunk(campaign: str, start: int, end: Optional[int]):
+    return run(_run_chunk(
+        campaign,
+        start,
+        lambda resume: rq.iter_recipients_for_query((resume, end)),
+        send_query,
+    ))
+
+
+@celery.task
+def broadcast_summary(results: list[dict], name: str, started_at: float):
+    report = BroadcastReport.merge(results, duration=time.time() - started_at)
+    print(f"[{name}] {report} — частей: {len(results)}")
+    return report.as_dict()
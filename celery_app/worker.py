@@ -0,0 +1,78 @@
+import asyncio
+import time
+from typing import Any, Coroutine, Optional
+
+from celery.signals import task_postrun, worker_process_init, worker_process_shutdown, worker_ready
+from celery.utils.log import current_process_index
+
+from celery_app import checkpoint
+from core.database.session import engine
+from core.http_client import http_client
+from core.metrics import push_metrics
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def run(coro: Coroutine) -> Any:
+    """Выполняет корутину задачи на постоянном event loop процесса-воркера."""
+    return get_loop().run_until_complete(coro)
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    # соединения пула, унаследованные от родителя при fork, дочернему процессу
+    # использовать нельзя: забываем их, не закрывая, и открываем свои
+    engine.sync_engine.dispose(close=False)
+    get_loop()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    if _loop is None or _loop.is_closed():
+        return
+    _loop.run_until_complete(http_client.close())
+    _loop.run_until_complete(checkpoint.close())
+    _loop.run_until_complete(engine.dispose())
+    _loop.close()
+
+
+@worker_ready.connect
+def recover_broadcasts(sender, **kwargs):
+    """
+    Ставит заново незавершённые части рассылок. Отложенные части, которые
+    держал погибший воркер, Redis вернул бы в очередь только через
+    visibility_timeout; дубли безопасны — части идут по чекпоинту и блокировке.
+    """
+    async def recoverable():
+        try:
+            return await checkpoint.recoverable()
+        finally:
+            await checkpoint.close()
+
+    try:
+        chunks = asyncio.run(recoverable())
+    except Exception as ex:
+        print(f"⚠️ Не удалось проверить незавершённые рассылки: {ex}")
+        return
+    now = time.time()
+    for chunk in chunks:
+        sender.app.send_task(chunk["task"], args=chunk["args"], countdown=max(0.0, chunk["eta"] - now))
+    if chunks:
+        print(f"↩️ Поставлено заново частей рассылки: {len(chunks)}")
+
+
+@task_postrun.connect
+def push_task_metrics(**kwargs):
+    try:
+        push_metrics("celery", str(current_process_index(base=0) or 0))
+    except Exception as ex:
+        print(f"⚠️ Не удалось отправить метрики: {ex}")
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import socket
+import uuid
+from typing import Optional
+
+from redis.asyncio import Redis
+
+import core.database.requests as rq
+from core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class HealthWriter:
+    """
+    Отложенная запись ответов на опрос.
+
+    Ответы копятся в памяти и пишутся одним INSERT, когда набирается max_rows
+    или проходит interval_ms. При durable=True каждый ответ сначала кладётся
+    в хэш Redis под своим id и удаляется оттуда (HDEL ровно записанных id)
+    только после записи в Postgres, так что после падения бота несохранённые
+    ответы дописываются при следующем старте. Хэш у каждого процесса свой —
+    redis_key:instance, по умолчанию instance — имя хоста (контейнера), —
+    поэтому реплики не подхватывают и не удаляют чужие ответы.
+    """
+
+    def __init__(
+            self,
+            max_rows: int = settings.HEALTH_BUFFER_SIZE,
+            interval_ms: int = settings.HEALTH_BUFFER_INTERVAL_MS,
+            durable: bool = settings.HEALTH_BUFFER_DURABLE,
+            redis_key: str = settings.HEALTH_BUFFER_REDIS_KEY,
+            instance: str = settings.HEALTH_BUFFER_INSTANCE or socket.gethostname(),
+    ):
+        self.max_rows = max_rows
+        self.interval = interval_ms / 1000
+        self.durable = durable
+        self.redis_key = f"{redis_key}:{instance}"
+
+        # (id ответа в Redis, (user_tg_id, health, kp))
+        self._rows: list[tuple[str, tuple[int, str, int]]] = []
+        self._stopping = False
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._redis: Optional[Redis] = None
+
+    async def start(self):
+        if self.durable:
+            self._redis = Redis.from_url(settings.REDIS_URL)
+            pending = await self._redis.hgetall(self.redis_key)
+            self._rows = [(row_id.decode(), tuple(json.loads(row))) for row_id, row in pending.items()]
+            if self._rows:
+                logger.info("Восстановлено %s несохранённых ответов", len(self._rows))
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def add(self, user_tg_id: int, health: str, kp: int):
+        row_id = uuid.uuid4().hex
+        row = (user_tg_id, health, kp)
+        if self._redis is not None:
+            await self._redis.hset(self.redis_key, row_id, json.dumps(row))
+        self._rows.append((row_id, row))
+        if len(self._rows) >= self.max_rows:
+            self._full.set()
+
+    async def flush(self):
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                await rq.add_health_batch([row for _, row in rows])
+            except BaseException as ex:
+                # в том числе CancelledError: пачка возвращается в буфер, а не теряется
+                self._rows = rows + self._rows
+                if not isinstance(ex, Exception):
+                    raise
+                logger.exception("Не удалось записать %s ответов, повторим позже", len(rows))
+                return
+            if self._redis is not None:
+                await self._redis.hdel(self.redis_key, *(row_id for row_id, _ in rows))
+
+    async def stop(self):
+        if self._task is not None:
+            # не отменяем цикл посреди INSERT: просим его выйти и дожидаемся
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+
+health_writer = HealthWriter()
@@ -0,0 +1,26 @@
+from collections import OrderedDict
+
+from core.settings import settings
+
+
+class KnownUsers:
+    """LRU-множество user_tg_id, уже зарегистрированных в БД: повторный /start не идёт в базу."""
+
+    def __init__(self, max_size: int = settings.KNOWN_USERS_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids: OrderedDict[int, None] = OrderedDict()
+
+    def __contains__(self, user_tg_id: int) -> bool:
+        if user_tg_id in self._ids:
+            self._ids.move_to_end(user_tg_id)
+            return True
+        return False
+
+    def add(self, user_tg_id: int):
+        self._ids[user_tg_id] = None
+        self._ids.move_to_end(user_tg_id)
+        if len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+
+known_users = KnownUsers()
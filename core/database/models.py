@@ -1,4 +1,6 @@
-from sqlalchemy import BigInteger, ForeignKey, String, Integer, Boolean
+import datetime
+
+from sqlalchemy import BigInteger, ForeignKey, String, Integer, Boolean, Index, text, Date, DateTime, JSON, Float, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -19,18 +21,22 @@ class User(Base):
 
 class Profile(Base):
     __tablename__ = "profiles"
-
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), unique=True)
     notifications: Mapped[bool] = mapped_column(Boolean, default=True)
     query: Mapped[bool] = mapped_column(Boolean, default=True)
     min_kp_notification: Mapped[int] = mapped_column(Integer, default=1)
+    # False — бот заблокирован или чат не найден; такие профили исключаются из рассылок
+    active: Mapped[bool] = mapped_column(Boolean, default=True, server_default=text("true"))
 
     user: Mapped["User"] = relationship(back_populates="profile")
 
 
 class Health(Base):
     __tablename__ = "health"
+    __table_args__ = (
+        Index("ix_health_user_id_kp_id", "user_id", "kp", "id", postgresql_include=["health"]),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
@@ -39,3 +45,24 @@ class Health(Base):
 
     user: Mapped["User"] = relationship(back_populates="health")
 
+
+class KpDaily(Base):
+    __tablename__ = "kp_daily"
+
+    date: Mapped[datetime.date] = mapped_column(Date, primary_key=True)
+    max_kp: Mapped[int] = mapped_column(Integer)
+    slots: Mapped[dict] = mapped_column(JSON, default=dict)
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class KpObservation(Base):
+    __tablename__ = "kp_observations"
+
+    time_tag: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    kp: Mapped[float] = mapped_column(Float)
+    status: Mapped[str] = mapped_column(String(16))
+    updated_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
@@ -1,155 +1,391 @@
-from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import selectinload
-
-
-from core.database.models import User, Profile, Health
-from core.database.session import LocalSession
-
-async def create_user_with_profile(user_tg_id: int, username: str) -> bool:
-    async with LocalSession() as session:
-        try:
-            user = User(user_tg_id=user_tg_id, username=username)
-            session.add(user)
-            profile = Profile(user=user)
-            session.add(profile)
-
-            await session.commit()
-            return True
-        except IntegrityError:
-            return False
-
-
+import datetime
+from typing import AsyncIterator, Optional, Tuple
+
+from sqlalchemy import Date, Integer, String, BigInteger, and_, cast, column, func, literal_column, not_, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+from core.database.models import User, Profile, Health, KpDaily, KpObservation
+from core.database.session import LocalSession, connection
+from core.settings import settings
+
+
+IdRange = Tuple[int, Optional[int]]
+# (начало, конец диапазона users.id, слот окна доставки)
+Chunk = Tuple[int, Optional[int], int]
+# (users.id, user_tg_id)
+Recipient = Tuple[int, int]
+
+
+@connection
+async def create_user_with_profile(user_tg_id: int, username: str, *, session: AsyncSession) -> bool:
+    """Регистрация за один запрос: INSERT users и profiles с ON CONFLICT DO NOTHING."""
+    new_user = (
+        insert(User)
+        .values(user_tg_id=user_tg_id, username=username or "None")
+        .on_conflict_do_nothing(index_elements=[User.user_tg_id])
+        .returning(User.id)
+        .cte("new_user")
+    )
+    stmt = (
+        insert(Profile)
+        .from_select(["user_id"], select(new_user.c.id))
+        .on_conflict_do_nothing(index_elements=[Profile.user_id])
+        .returning(Profile.id)
+    )
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none() is not None
+
+
+@connection
 async def get_profile_by_tg_id(
         user_tg_id: int,
-) -> (bool, bool):
-    async with LocalSession() as session:
-        stmt = (
-            select(User)
-            .where(User.user_tg_id == user_tg_id)
-            .options(selectinload(User.profile))
-            .limit(1)
-        )
-        result = await session.execute(stmt)
-        user = result.scalar_one_or_none()
-        return user.profile.notifications, user.profile.query, user.profile.min_kp_notification
-
-
+        *,
+        session: AsyncSession,
+) -> (bool, bool, int):
+    stmt = (
+        select(Profile.notifications, Profile.query, Profile.min_kp_notification)
+        .join(User, User.id == Profile.user_id)
+        .where(User.user_tg_id == user_tg_id)
+        .limit(1)
+    )
+    result = await session.execute(stmt)
+    return result.one_or_none()
+
+
+def _profile_of(user_tg_id: int):
+    return Profile.user_id == (
+        select(User.id)
+        .where(User.user_tg_id == user_tg_id)
+        .scalar_subquery()
+    )
+
+
+@connection
 async def toggle_profile_flag(
     user_tg_id: int,
     field: str,
-):
-    async with LocalSession() as session:
-        stmt = (
-            select(User)
-            .where(User.user_tg_id == user_tg_id)
-            .options(selectinload(User.profile))
+    *,
+    session: AsyncSession,
+) -> Optional[Tuple[bool, bool, int]]:
+    """Переключает флаг профиля одним UPDATE ... RETURNING и возвращает профиль."""
+    if field not in ("notifications", "query"):
+        raise AttributeError(f"Profile has no field '{field}'")
+    column = getattr(Profile, field)
+
+    stmt = (
+        update(Profile)
+        .where(_profile_of(user_tg_id))
+        .values({column: not_(column)})
+        .returning(Profile.notifications, Profile.query, Profile.min_kp_notification)
+    )
+    result = await session.execute(stmt)
+    profile = result.one_or_none()
+    return profile
+
+
+def _user_ids_stmt(condition, id_range: Optional[IdRange] = None):
+    stmt = (
+        select(User.user_tg_id)
+        .join(Profile, User.id == Profile.user_id)
+        .where(condition)
+    )
+    if id_range is not None:
+        start, end = id_range
+        stmt = stmt.where(User.id >= start)
+        if end is not None:
+            stmt = stmt.where(User.id < end)
+        stmt = stmt.order_by(User.id)
+    return stmt
+
+
+def _query_condition():
+    return and_(Profile.active.is_(True), Profile.query.is_(True))
+
+
+def _kp_condition(kp: int):
+    return and_(Profile.active.is_(True), Profile.min_kp_notification <= kp)
+
+
+async def _chunks(condition, chunk_size: int, slots: int, session: AsyncSession) -> list[Chunk]:
+    # получатели поровну делятся на slots слотов по порядку users.id,
+    # каждый слот режется на keyset-диапазоны не больше chunk_size — один проход
+    numbered = (
+        select(
+            User.id,
+            func.row_number().over(order_by=User.id).label("rn"),
+            func.count().over().label("total"),
         )
-
-        result = await session.execute(stmt)
-        user = result.scalar_one_or_none()
-
-        if not user or not user.profile:
-            return False
-
-        if not hasattr(user.profile, field):
-            raise AttributeError(f"Profile has no field '{field}'")
-
-        current_value = getattr(user.profile, field)
-        setattr(user.profile, field, not current_value)
-
-        await session.commit()
-        return True
-
-
-async def get_user_ids_for_query():
+        .join(Profile, User.id == Profile.user_id)
+        .where(condition)
+        .subquery()
+    )
+    slotted = select(
+        numbered.c.id,
+        ((numbered.c.rn - 1) * slots // numbered.c.total).label("slot"),
+    ).subquery()
+    positioned = select(
+        slotted.c.id,
+        slotted.c.slot,
+        func.row_number().over(partition_by=slotted.c.slot, order_by=slotted.c.id).label("pos"),
+    ).subquery()
+    stmt = (
+        select(positioned.c.id, positioned.c.slot)
+        .where((positioned.c.pos - 1) % chunk_size == 0)
+        .order_by(positioned.c.id)
+    )
+    result = await session.execute(stmt)
+    starts = result.all()
+    return [
+        (start, starts[i + 1][0] if i + 1 < len(starts) else None, slot)
+        for i, (start, slot) in enumerate(starts)
+    ]
+
+
+@connection
+async def get_chunks_for_query(
+        chunk_size: int,
+        slots: int = 1,
+        *,
+        session: AsyncSession,
+) -> list[Chunk]:
+    return await _chunks(_query_condition(), chunk_size, slots, session)
+
+
+async def _stream_recipients(condition, id_range: IdRange, chunk_size: int) -> AsyncIterator[list[Recipient]]:
+    # server-side курсор: память не растёт с числом пользователей, а рассылка
+    # начинается с первой пачки; users.id — ключ, по которому чекпоинт продолжает работу
+    stmt = _user_ids_stmt(condition, id_range).with_only_columns(User.id, User.user_tg_id)
     async with LocalSession() as session:
-        stmt = (
-            select(User.user_tg_id)
-            .join(Profile, User.id == Profile.user_id)
-            .where(Profile.query.is_(True))
+        result = await session.stream(stmt.execution_options(yield_per=chunk_size))
+        async for chunk in result.partitions(chunk_size):
+            yield [(user_id, user_tg_id) for user_id, user_tg_id in chunk]
+
+
+def iter_recipients_for_query(
+        id_range: IdRange,
+        chunk_size: int = settings.BROADCAST_BATCH_SIZE,
+) -> AsyncIterator[list[Recipient]]:
+    return _stream_recipients(_query_condition(), id_range, chunk_size)
+
+
+@connection
+async def set_user_active(user_tg_id: int, active: bool, *, session: AsyncSession) -> bool:
+    """Отмечает, может ли пользователь получать рассылки (блокировка/разблокировка бота)."""
+    result = await session.execute(
+        update(Profile)
+        .where(_profile_of(user_tg_id), Profile.active.is_not(active))
+        .values(active=active)
+    )
+    return result.rowcount > 0
+
+
+@connection
+async def deactivate_users(user_tg_ids: list[int], *, session: AsyncSession) -> int:
+    """Пачка недоступных получателей одним UPDATE ... FROM users; возвращает число отключённых профилей."""
+    if not user_tg_ids:
+        return 0
+    result = await session.execute(
+        update(Profile)
+        .where(
+            Profile.user_id == User.id,
+            User.user_tg_id.in_(user_tg_ids),
+            Profile.active.is_(True),
         )
-        result = await session.execute(stmt)
-        return result.scalars().all()
+        .values(active=False)
+    )
+    return result.rowcount
 
 
-async def update_query_by_tg_id(
-        user_tg_id: int,
-        query: str,
-        kp,
+@connection
+async def add_health_batch(
+        rows: list[tuple[int, str, int]],
+        *,
+        session: AsyncSession,
 ):
-    async with LocalSession() as session:
-        result = await session.execute(
-            select(User.id).where(User.user_tg_id == user_tg_id)
-        )
-        user_id = result.scalar_one_or_none()
-
-        if user_id is None:
-            return False
-
-
-        new_notification = Health(
-            user_id=user_id,
-            health=query,
-            kp=kp
-        )
-        session.add(new_notification)
-        await session.commit()
-        return True
+    """Пачка ответов (user_tg_id, health, kp) одним INSERT ... SELECT; неизвестные пользователи пропускаются."""
+    if not rows:
+        return
+    answers = values(
+        column("user_tg_id", BigInteger),
+        column("health", String),
+        column("kp", Integer),
+        name="answers",
+    ).data(rows)
+    stmt = insert(Health).from_select(
+        ["user_id", "health", "kp"],
+        select(User.id, answers.c.health, answers.c.kp)
+        .join(answers, User.user_tg_id == answers.c.user_tg_id),
+    )
+    await session.execute(stmt)
+
+
+@connection
+async def get_chunks_for_kp(
+        kp: int,
+        chunk_size: int,
+        slots: int = 1,
+        *,
+        session: AsyncSession,
+) -> list[Chunk]:
+    return await _chunks(_kp_condition(kp), chunk_size, slots, session)
 
 
-async def get_user_ids_for_kp(kp: int) -> list[int]:
-    async with LocalSession() as session:
-        stmt = (
-            select(User.user_tg_id)
-            .join(Profile, User.id == Profile.user_id)
-            .where(Profile.min_kp_notification <= kp)
-        )
-        result = await session.execute(stmt)
-        return [row[0] for row in result.all()]
+def iter_recipients_for_kp(
+        kp: int,
+        id_range: IdRange,
+        chunk_size: int = settings.BROADCAST_BATCH_SIZE,
+) -> AsyncIterator[list[Recipient]]:
+    return _stream_recipients(_kp_condition(kp), id_range, chunk_size)
 
 
 
+@connection
 async def change_min_kp_notification(
     user_tg_id: int,
     delta: int,
-) -> bool:
-    async with LocalSession() as session:
-        stmt = (
-            select(User)
-            .where(User.user_tg_id == user_tg_id)
-            .options(selectinload(User.profile))
-        )
-
-        result = await session.execute(stmt)
-        user = result.scalar_one_or_none()
-
-        if not user or not user.profile:
-            return False
-
-        user.profile.min_kp_notification += delta
-
-        await session.commit()
-        return True
-
-
-async def get_last_health_by_kp_for_user(
-        user_tg_id: int,
+    *,
+    session: AsyncSession,
+) -> Optional[Tuple[bool, bool, int]]:
+    """
+    Сдвигает порог уведомлений на delta в пределах 1..9 одним UPDATE ... RETURNING.
+    Возвращает профиль или None, если значение уже на границе (или профиля нет).
+    """
+    clamped = func.least(func.greatest(Profile.min_kp_notification + delta, 1), 9)
+
+    stmt = (
+        update(Profile)
+        .where(_profile_of(user_tg_id), Profile.min_kp_notification != clamped)
+        .values(min_kp_notification=clamped)
+        .returning(Profile.notifications, Profile.query, Profile.min_kp_notification)
+    )
+    result = await session.execute(stmt)
+    profile = result.one_or_none()
+    return profile
+
+
+@connection
+async def get_last_health_by_kp_for_users(
+        user_tg_ids: list[int],
         kp: int,
-        limit: int = 3
-) -> list[str]:
-    async with LocalSession() as session:
-        stmt = (
-            select(Health.health)
-            .join(User, User.id == Health.user_id)
-            .where(
-                User.user_tg_id == user_tg_id,
-                Health.kp == kp
-            )
-            .order_by(Health.id.desc())
-            .limit(limit)
+        limit: int = 3,
+        *,
+        session: AsyncSession,
+) -> dict[int, list[str]]:
+    """Последние limit оценок при данном kp сразу для пачки пользователей — одним запросом."""
+    if not user_tg_ids:
+        return {}
+
+    ranked = (
+        select(
+            User.user_tg_id,
+            Health.health,
+            func.row_number().over(
+                partition_by=Health.user_id,
+                order_by=Health.id.desc(),
+            ).label("rn"),
         )
-
-        result = await session.execute(stmt)
-        return result.scalars().all()
-
+        .join(User, User.id == Health.user_id)
+        .where(
+            User.user_tg_id.in_(user_tg_ids),
+            Health.kp == kp
+        )
+        .subquery()
+    )
+    stmt = (
+        select(ranked.c.user_tg_id, ranked.c.health)
+        .where(ranked.c.rn <= limit)
+        .order_by(ranked.c.user_tg_id, ranked.c.rn)
+    )
+
+    result = await session.execute(stmt)
+    last: dict[int, list[str]] = {}
+    for user_tg_id, health in result.all():
+        last.setdefault(user_tg_id, []).append(health)
+    return last
+
+
+@connection
+async def rebuild_kp_daily(
+        since: datetime.datetime,
+        *,
+        session: AsyncSession,
+) -> dict[datetime.date, int]:
+    """
+    Пересчитывает kp_daily из kp_observations за дни, начиная с since (UTC):
+    максимум и значения 3-часовых слотов (Kp округлён вверх). Возвращает {дата: max_kp}.
+    """
+    # 'UTC' литералом, а не параметром: иначе выражение в GROUP BY не совпадёт с выражением в SELECT
+    utc_time = func.timezone(literal_column("'UTC'"), KpObservation.time_tag)
+    day = cast(utc_time, Date)
+    slot_kp = cast(func.ceil(KpObservation.kp), Integer)
+    daily = (
+        select(
+            day,
+            func.max(slot_kp),
+            func.json_object_agg(func.to_char(utc_time, "HH24:MI"), slot_kp),
+        )
+        .where(KpObservation.time_tag >= since)
+        .group_by(day)
+    )
+    stmt = insert(KpDaily).from_select(["date", "max_kp", "slots"], daily)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[KpDaily.date],
+        set_={
+            "max_kp": stmt.excluded.max_kp,
+            "slots": stmt.excluded.slots,
+            "updated_at": func.now(),
+        },
+    ).returning(KpDaily.date, KpDaily.max_kp)
+    result = await session.execute(stmt)
+    return {day: max_kp for day, max_kp in result.all()}
+
+
+@connection
+async def get_max_kp_for_date(
+        day: datetime.date,
+        *,
+        session: AsyncSession,
+) -> Optional[int]:
+    result = await session.execute(
+        select(KpDaily.max_kp).where(KpDaily.date == day)
+    )
+    return result.scalar_one_or_none()
+
+
+@connection
+async def get_last_observed_time(*, session: AsyncSession) -> Optional[datetime.datetime]:
+    result = await session.execute(
+        select(func.max(KpObservation.time_tag)).where(KpObservation.status == "observed")
+    )
+    return result.scalar_one_or_none()
+
+
+@connection
+async def upsert_kp_observations(
+        rows: list[tuple[datetime.datetime, float, str]],
+        *,
+        session: AsyncSession,
+) -> int:
+    """Вставляет новые слоты и обновляет только изменившиеся; возвращает число затронутых строк."""
+    if not rows:
+        return 0
+    stmt = insert(KpObservation).values([
+        {"time_tag": time_tag, "kp": kp, "status": status}
+        for time_tag, kp, status in rows
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[KpObservation.time_tag],
+        set_={
+            "kp": stmt.excluded.kp,
+            "status": stmt.excluded.status,
+            "updated_at": func.now(),
+        },
+        where=(
+            KpObservation.kp.is_distinct_from(stmt.excluded.kp)
+            | KpObservation.status.is_distinct_from(stmt.excluded.status)
+        ),
+    )
+    result = await session.execute(stmt)
+    return result.rowcount
@@ -1,4 +1,8 @@
+from functools import wraps
+from typing import Optional
+
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from core.metrics import TimedAsyncPool, instrument_engine
 from core.settings import settings
 
 engine = create_async_engine(
@@ -7,11 +11,29 @@ engine = create_async_engine(
     pool_pre_ping=True,
     pool_size=10,
     max_overflow=20,
+    poolclass=TimedAsyncPool,
 )
+instrument_engine(engine)
 
 LocalSession = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False,
     autoflush=False,
-)
\ No newline at end of file
+)
+
+
+def connection(func):
+    """
+    Даёт функции репозитория сессию: переданную явно (session=...),
+    например из DatabaseMiddleware, или собственную с транзакцией на один вызов.
+    """
+    @wraps(func)
+    async def wrapper(*args, session: Optional[AsyncSession] = None, **kwargs):
+        if session is not None:
+            return await func(*args, session=session, **kwargs)
+        async with LocalSession() as session:
+            async with session.begin():
+                return await func(*args, session=session, **kwargs)
+
+    return wrapper
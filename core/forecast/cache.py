@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+from core.forecast.series import KpSeries
+from core.http_client import http_client
+from core.metrics import FORECAST_CACHE, NOAA_FETCH
+from core.settings import settings
+
+
+class ForecastCache:
+    """
+    Кэш прогноза NOAA в памяти процесса.
+
+    Данные живут ttl секунд, после чего перепроверяются условным запросом
+    (ETag / If-Modified-Since). Одновременные вызовы во время обновления
+    ждут один и тот же запрос к NOAA, а не делают свои.
+    """
+
+    def __init__(self, url: str, ttl: int):
+        self.url = url
+        self.ttl = ttl
+        self.version = 0
+
+        self._data: Optional[list] = None
+        self._fetched_at = 0.0
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._series: Optional[KpSeries] = None
+        self._series_version = -1
+
+    def is_fresh(self) -> bool:
+        return self._data is not None and time.monotonic() - self._fetched_at < self.ttl
+
+    async def get(self) -> Any:
+        if self.is_fresh():
+            FORECAST_CACHE.labels("hit").inc()
+            return self._data
+        FORECAST_CACHE.labels("miss").inc()
+
+        if self._inflight is None or self._inflight.get_loop() is not asyncio.get_running_loop():
+            self._inflight = asyncio.ensure_future(self._refresh())
+            self._inflight.add_done_callback(self._release)
+
+        try:
+            # shield: отмена одного ожидающего не должна отменять общий запрос
+            return await asyncio.shield(self._inflight)
+        except Exception:
+            # NOAA недоступен — лучше отдать устаревшие данные, чем ошибку
+            if self._data is not None:
+                FORECAST_CACHE.labels("stale").inc()
+                return self._data
+            raise
+
+    async def series(self) -> KpSeries:
+        """Разобранный прогноз; парсится один раз на каждую новую версию данных."""
+        data = await self.get()
+        if self._series is None or self._series_version != self.version:
+            self._series = KpSeries.parse(data)
+            self._series_version = self.version
+        return self._series
+
+    def _release(self, future: asyncio.Future):
+        if self._inflight is future:
+            self._inflight = None
+        if not future.cancelled():
+            future.exception()  # помечаем исключение как обработанное
+
+    async def _refresh(self) -> Any:
+        headers = {}
+        if self._data is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+        session = await http_client.session()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with session.get(self.url, headers=headers) as response:
+                status = str(response.status)
+                if response.status == 304 and self._data is not None:
+                    self._fetched_at = time.monotonic()
+                    return self._data
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+                self._etag = response.headers.get("ETag")
+                self._last_modified = response.headers.get("Last-Modified")
+        finally:
+            NOAA_FETCH.labels(status).observe(time.perf_counter() - started)
+
+        self._data = data
+        self._fetched_at = time.monotonic()
+        self.version += 1
+        return data
+
+
+forecast_cache = ForecastCache(settings.NOAA_FORECAST_URL, settings.FORECAST_CACHE_TTL)
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from core.forecast.series import KpSeries
+
+
+def render_report(series: KpSeries, target_date: date) -> str:
+    rows = series.day(target_date)
+
+    if not rows:
+        return f"⚠️ Данные за {target_date.strftime('%d.%m.%Y')} пока не опубликованы."
+
+    max_kp = series.max_for(target_date)
+
+    date_str = target_date.strftime("%d.%m.%Y")
+    lines = [f"🧲 *Геомагнитная обстановка — {date_str}*"]
+
+    for dt, kp, obs in rows:
+        time_hm = dt.strftime("%H:%M")
+
+        if kp < 4:
+            emoji, desc = "🟢", "спокойно"
+        elif kp < 5:
+            emoji, desc = "🟡", "неустойчиво"
+        elif kp < 6:
+            emoji, desc = "🟠", "слабая буря (G1)"
+        elif kp < 7:
+            emoji, desc = "🔴", "умеренная буря (G2)"
+        elif kp < 8:
+            emoji, desc = "⚫", "сильная буря (G3)"
+        else:
+            emoji, desc = "💥", "экстремальная буря"
+
+        if "obs" in obs or "real" in obs:
+            src = "☑️"
+        elif "forecast" in obs or "pred" in obs or "est" in obs:
+            src = "🌓"
+        else:
+            src = "—"
+
+        lines.append(f"{emoji} *{time_hm}* — Kp = {kp} → {desc} {src}")
+
+    if max_kp < 4:
+        summary = "🟢 Спокойная геомагнитная обстановка."
+    elif max_kp < 5:
+        summary = "🟡 Небольшие возмущения."
+    elif max_kp < 6:
+        summary = "🟠 Слабая буря (G1)."
+    elif max_kp < 7:
+        summary = "🔴 Умеренная буря (G2)."
+    elif max_kp < 8:
+        summary = "⚫ Сильная буря (G3)."
+    else:
+        summary = "⚠️ Экстремальная геомагнитная активность!"
+
+    lines.append("")
+    lines.append(f"📌 *Макс. Kp за день*: {max_kp}")
+    lines.append(summary)
+
+    return "\n".join(lines)
+
+
+class ReportCache:
+    """
+    Готовые тексты отчётов на сегодня и завтра.
+
+    Отчёт одинаков для всех пользователей, поэтому рендерится один раз на пару
+    (UTC-дата, версия данных NOAA) и сбрасывается при смене даты или данных.
+    """
+
+    def __init__(self):
+        self._key: Optional[Tuple[date, int]] = None
+        self._reports: Dict[date, str] = {}
+
+    def get(self, series: KpSeries, version: int, target_date: date) -> str:
+        today = datetime.now(timezone.utc).date()
+        if self._key != (today, version):
+            self._reports = {
+                day: render_report(series, day)
+                for day in (today, today + timedelta(days=1))
+            }
+            self._key = (today, version)
+
+        report = self._reports.get(target_date)
+        if report is None:
+            report = render_report(series, target_date)
+        return report
+
+
+report_cache = ReportCache()
@@ -0,0 +1,121 @@
+import math
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+class KpSeriesError(ValueError):
+    pass
+
+
+def _parse_time(time_str: str) -> datetime:
+    # Поддерживаем оба формата: "2025-11-21 00:00:00" и "2025-11-21T00:00:00Z"
+    if "T" in time_str:
+        dt = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return datetime.strptime(
+        time_str.strip(), "%Y-%m-%d %H:%M:%S"
+    ).replace(tzinfo=timezone.utc)
+
+
+class KpSeries:
+    """
+    Разобранный прогноз NOAA: отсортированные по времени слоты в массивах
+    и индекс «дата (UTC) -> диапазон слотов». Строится один раз на ответ NOAA,
+    дальше любые выборки по дню — срез без повторного парсинга.
+    """
+
+    __slots__ = ("timestamps", "values", "kp", "sources", "_days")
+
+    def __init__(self, rows: List[Tuple[datetime, float, str]]):
+        rows.sort(key=lambda x: x[0])
+        self.timestamps = array("d", (dt.timestamp() for dt, _, _ in rows))
+        self.values = array("d", (value for _, value, _ in rows))
+        self.kp = array("B", (math.ceil(value) for _, value, _ in rows))  # безопаснее для Kp
+        self.sources = tuple(obs for _, _, obs in rows)
+
+        self._days: Dict[date, Tuple[int, int]] = {}
+        for i, (dt, _, _) in enumerate(rows):
+            start, _ = self._days.get(dt.date(), (i, i))
+            self._days[dt.date()] = (start, i + 1)
+
+    @classmethod
+    def parse(cls, data: list) -> "KpSeries":
+        if not data or len(data) < 2:
+            raise KpSeriesError("❌ Пустой ответ от NOAA.")
+
+        headers = data[0]
+
+        try:
+            time_col = next(
+                i for i, h in enumerate(headers)
+                if "time" in h.lower()
+            )
+            kp_col = next(
+                i for i, h in enumerate(headers)
+                if "kp" in h.lower()
+            )
+        except StopIteration:
+            raise KpSeriesError(f"❌ Не найдены нужные столбцы. Заголовки: {headers}")
+        obs_col = next(
+            (i for i, h in enumerate(headers)
+             if "obs" in h.lower() or "forecast" in h.lower() or "status" in h.lower()),
+            None
+        )
+
+        rows: List[Tuple[datetime, float, str]] = []
+        for row in data[1:]:
+            if len(row) <= max(time_col, kp_col):
+                continue
+
+            time_str = row[time_col]
+            kp_str = row[kp_col]
+            obs_type = row[obs_col].lower() if obs_col is not None and row[obs_col] else ""
+
+            if not time_str or not kp_str:
+                continue
+
+            try:
+                dt = _parse_time(time_str)
+                value = float(kp_str)
+            except (ValueError, TypeError):
+                continue
+            # kp хранится в array("B"): NaN, inf и значения вне шкалы 0..9 пропускаем, как и битые строки
+            if not math.isfinite(value) or not 0 <= value <= 9:
+                continue
+
+            rows.append((dt, value, obs_type))
+
+        return cls(rows)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def day(self, target_date: date) -> List[Tuple[datetime, int, str]]:
+        start, stop = self._days.get(target_date, (0, 0))
+        return [
+            (datetime.fromtimestamp(self.timestamps[i], timezone.utc), self.kp[i], self.sources[i])
+            for i in range(start, stop)
+        ]
+
+    def day_values(self, target_date: date) -> List[Tuple[datetime, float, str]]:
+        start, stop = self._days.get(target_date, (0, 0))
+        return [
+            (datetime.fromtimestamp(self.timestamps[i], timezone.utc), self.values[i], self.sources[i])
+            for i in range(start, stop)
+        ]
+
+    def slots(self, since: Optional[datetime] = None) -> List[Tuple[datetime, float, str]]:
+        """Все слоты (время, Kp, статус), опционально только позже since."""
+        start = 0 if since is None else bisect_right(self.timestamps, since.timestamp())
+        return [
+            (datetime.fromtimestamp(self.timestamps[i], timezone.utc), self.values[i], self.sources[i])
+            for i in range(start, len(self.timestamps))
+        ]
+
+    def max_for(self, target_date: date) -> Optional[int]:
+        start, stop = self._days.get(target_date, (0, 0))
+        if start == stop:
+            return None
+        return max(self.kp[start:stop])
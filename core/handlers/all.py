@@ -1,18 +1,37 @@
-from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery
+import logging
+from datetime import datetime, timezone
+
+from aiogram.filters import CommandStart, ChatMemberUpdatedFilter, KICKED, MEMBER
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram import Bot, Router, F
+from sqlalchemy.ext.asyncio import AsyncSession
+
 import core.keyboards.inline as ikb
 import core.database.requests as rq
 import core.handlers.texts as txt
+from core.database.buffer import health_writer
+from core.database.known_users import known_users
+from core.middlewares.database import DatabaseMiddleware
+from core.middlewares.metrics import MetricsMiddleware
+
 
+logger = logging.getLogger(__name__)
 
 router = Router()
+router.message.outer_middleware(MetricsMiddleware())
+router.callback_query.outer_middleware(MetricsMiddleware())
+router.message.middleware(DatabaseMiddleware())
+router.callback_query.middleware(DatabaseMiddleware())
 
 
 @router.message(CommandStart())
-async def start(message: Message):
+async def start(message: Message, session: AsyncSession):
     await message.answer(txt.start, reply_markup=ikb.main)
-    await rq.create_user_with_profile(message.from_user.id, message.from_user.username)
+    if message.from_user.id not in known_users:
+        await rq.create_user_with_profile(message.from_user.id, message.from_user.username, session=session)
+        await session.commit()
+        # в кэш — только после коммита: если он не прошёл, следующий /start повторит вставку
+        known_users.add(message.from_user.id)
 
 @router.callback_query(F.data == "predict_weather")
 async def predict_weather(callback: CallbackQuery, bot: Bot):
@@ -42,10 +61,9 @@ async def back_to_main(callback: CallbackQuery, bot: Bot):
 
 
 
-@router.callback_query(F.data == "settings")
-async def settings(callback: CallbackQuery, bot: Bot):
+@router.callback_query(F.data == "settings", flags={"profile": True})
+async def settings(callback: CallbackQuery, bot: Bot, profile: tuple):
     await callback.answer()
-    profile = await rq.get_profile_by_tg_id(callback.from_user.id)
     keyboard = await ikb.settings(profile[0], profile[1], profile[2])
     await bot.edit_message_text(chat_id=callback.message.chat.id,
                                 message_id=callback.message.message_id,
@@ -53,10 +71,10 @@ async def settings(callback: CallbackQuery, bot: Bot):
                                 reply_markup=keyboard)
 
 @router.callback_query(F.data == "notifications")
-async def notifications(callback: CallbackQuery, bot: Bot):
+async def notifications(callback: CallbackQuery, bot: Bot, session: AsyncSession):
     await callback.answer()
-    await rq.toggle_profile_flag(callback.from_user.id, "notifications")
-    profile = await rq.get_profile_by_tg_id(callback.from_user.id)
+    profile = await rq.toggle_profile_flag(callback.from_user.id, "notifications", session=session)
+    await session.commit()
     keyboard = await ikb.settings(profile[0], profile[1], profile[2])
     await bot.edit_message_text(chat_id=callback.message.chat.id,
                                 message_id=callback.message.message_id,
@@ -64,10 +82,10 @@ async def notifications(callback: CallbackQuery, bot: Bot):
                                 reply_markup=keyboard)
 
 @router.callback_query(F.data == "query")
-async def notifications(callback: CallbackQuery, bot: Bot):
+async def query(callback: CallbackQuery, bot: Bot, session: AsyncSession):
     await callback.answer()
-    await rq.toggle_profile_flag(callback.from_user.id, "query")
-    profile = await rq.get_profile_by_tg_id(callback.from_user.id)
+    profile = await rq.toggle_profile_flag(callback.from_user.id, "query", session=session)
+    await session.commit()
     keyboard = await ikb.settings(profile[0], profile[1], profile[2])
     await bot.edit_message_text(chat_id=callback.message.chat.id,
                                 message_id=callback.message.message_id,
@@ -76,14 +94,13 @@ async def notifications(callback: CallbackQuery, bot: Bot):
 
 
 @router.callback_query(F.data == "minus")
-async def minus(callback: CallbackQuery, bot: Bot):
-    min_kp = await rq.get_profile_by_tg_id(callback.from_user.id)
-    if min_kp[-1] == 1:
+async def minus(callback: CallbackQuery, bot: Bot, session: AsyncSession):
+    profile = await rq.change_min_kp_notification(callback.from_user.id, -1, session=session)
+    await session.commit()
+    if profile is None:
         await callback.answer(txt.min_value)
     else:
         await callback.answer()
-        await rq.change_min_kp_notification(callback.from_user.id, -1)
-        profile = await rq.get_profile_by_tg_id(callback.from_user.id)
         keyboard = await ikb.settings(profile[0], profile[1], profile[2])
         await bot.edit_message_text(chat_id=callback.message.chat.id,
                                     message_id=callback.message.message_id,
@@ -92,26 +109,33 @@ async def minus(callback: CallbackQuery, bot: Bot):
 
 
 @router.callback_query(F.data == "plus")
-async def minus(callback: CallbackQuery, bot: Bot):
-    max_kp = await rq.get_profile_by_tg_id(callback.from_user.id)
-    if max_kp[-1] == 9:
+async def plus(callback: CallbackQuery, bot: Bot, session: AsyncSession):
+    profile = await rq.change_min_kp_notification(callback.from_user.id, +1, session=session)
+    await session.commit()
+    if profile is None:
         await callback.answer(txt.max_value)
     else:
-        await rq.change_min_kp_notification(callback.from_user.id, +1)
-        profile = await rq.get_profile_by_tg_id(callback.from_user.id)
+        await callback.answer()
         keyboard = await ikb.settings(profile[0], profile[1], profile[2])
         await bot.edit_message_text(chat_id=callback.message.chat.id,
                                     message_id=callback.message.message_id,
                                     text=txt.setup,
                                     reply_markup=keyboard)
-    await callback.answer()
 
 @router.callback_query(F.data.startswith("query"))
-async def all_good(callback: CallbackQuery, bot: Bot):
+async def all_good(callback: CallbackQuery, bot: Bot, session: AsyncSession):
     await callback.answer()
-    kp = await txt.get_kp_forecast_report(only_max=True)
+    kp = await rq.get_max_kp_for_date(datetime.now(timezone.utc).date(), session=session)
+    await session.commit()
+    if kp is None:
+        kp = await txt.get_kp_forecast_report(only_max=True)
     health = callback.data.split()[-1]
-    await rq.update_query_by_tg_id(user_tg_id=callback.from_user.id, kp=kp, query=health)
+    if isinstance(kp, int):
+        await health_writer.add(callback.from_user.id, health, kp)
+    else:
+        # без Kp ответ не с чем сопоставить: ни kp_daily, ни NOAA сейчас недоступны
+        logger.warning("Ответ на опрос не сохранён: user_tg_id=%s, health=%s, Kp неизвестен (%s)",
+                       callback.from_user.id, health, kp)
     await bot.edit_message_text(chat_id=callback.message.chat.id,
                                 message_id=callback.message.message_id,
                                 text=txt.gratitude, reply_markup=ikb.main)
@@ -119,3 +143,14 @@ async def all_good(callback: CallbackQuery, bot: Bot):
 @router.callback_query(F.data.startswith("order_user"))
 async def _order_user(callback: CallbackQuery, bot: Bot):
     await callback.answer(txt._order_user)
+
+
+# пользователь заблокировал или разблокировал бота — исключаем его из рассылок или возвращаем
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked(event: ChatMemberUpdated):
+    await rq.set_user_active(event.from_user.id, False)
+
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def bot_unblocked(event: ChatMemberUpdated):
+    await rq.set_user_active(event.from_user.id, True)
@@ -0,0 +1,57 @@
+import asyncio
+from typing import Optional
+
+import aiohttp
+
+from core.settings import settings
+
+
+class HttpClient:
+    """
+    Общий aiohttp.ClientSession процесса: keep-alive пул соединений,
+    кэш DNS и лимит соединений на хост. Открывается при старте бота/воркера
+    и закрывается при остановке, чтобы исходящие запросы шли по тёплым соединениям.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self, trace_configs: Optional[list[aiohttp.TraceConfig]] = None) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed:
+            if self._loop is loop:
+                return self._session
+            await self.close()
+
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_LIMIT,
+            limit_per_host=settings.HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=settings.HTTP_DNS_TTL,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10),
+            trace_configs=trace_configs,
+        )
+        self._loop = loop
+        return self._session
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed or self._loop is not asyncio.get_running_loop():
+            return await self.start()
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            try:
+                await self._session.close()
+            except RuntimeError:
+                # сессия привязана к уже закрытому event loop
+                pass
+        self._session = None
+        self._loop = None
+
+
+http_client = HttpClient()
@@ -0,0 +1,85 @@
+import socket
+import time
+
+from prometheus_client import Counter, Histogram, push_to_gateway, start_http_server, REGISTRY
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from core.settings import settings
+
+
+HANDLER_LATENCY = Histogram(
+    "bot_handler_seconds", "Время обработки апдейта хендлером", ["handler"],
+)
+DB_STATEMENT = Histogram(
+    "db_statement_seconds", "Время выполнения SQL-запроса", ["statement"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds", "Ожидание соединения из пула",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+NOAA_FETCH = Histogram(
+    "noaa_fetch_seconds", "Запрос прогноза к NOAA", ["status"],
+)
+FORECAST_CACHE = Counter(
+    "forecast_cache_requests_total", "Обращения к кэшу прогноза", ["result"],
+)
+TELEGRAM_SEND = Histogram(
+    "telegram_send_seconds", "Запрос sendMessage при рассылке", ["campaign"],
+)
+BROADCAST_MESSAGES = Counter(
+    "broadcast_messages_total", "Итоги доставки сообщений рассылки", ["campaign", "result"],
+)
+TELEGRAM_FLOOD_WAITS = Counter(
+    "telegram_flood_waits_total", "Ответы 429 от Telegram", ["campaign"],
+)
+
+
+class TimedAsyncPool(AsyncAdaptedQueuePool):
+    """Пул соединений, который замеряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT.observe(time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_STATEMENT.labels(kind).observe(time.perf_counter() - started)
+
+
+def start_metrics_server():
+    """HTTP-эндпоинт /metrics для бота; METRICS_PORT=0 отключает его."""
+    if settings.METRICS_PORT:
+        start_http_server(settings.METRICS_PORT)
+
+
+def push_metrics(job: str, process: str):
+    """
+    Отправка метрик воркера Celery в Pushgateway, если он настроен.
+
+    Группа — хост и номер процесса в пуле: процесс, которым пул заменил
+    отработавший, получает тот же номер и перезаписывает группу, поэтому
+    групп не больше, чем процессов, и устаревшие не копятся.
+    """
+    if not settings.METRICS_PUSHGATEWAY_URL:
+        return
+    push_to_gateway(
+        settings.METRICS_PUSHGATEWAY_URL,
+        job=job,
+        grouping_key={"instance": socket.gethostname(), "process": process},
+        registry=REGISTRY,
+    )
@@ -0,0 +1,27 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class ConcurrencyMiddleware(BaseMiddleware):
+    """
+    Ограничивает число апдейтов, которые обрабатываются одновременно.
+
+    И polling, и webhook запускают каждый апдейт отдельной задачей, поэтому
+    без лимита всплеск апдейтов упирается в пул соединений БД. Лишние
+    апдейты ждут здесь, не занимая соединений.
+    """
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        async with self.semaphore:
+            return await handler(event, data)
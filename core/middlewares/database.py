@@ -0,0 +1,43 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import TelegramObject
+
+import core.database.requests as rq
+from core.database.session import LocalSession
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    """
+    Одна AsyncSession на апдейт.
+
+    Соединение берётся из пула только при первом запросе, так что хендлеры
+    без БД пул не трогают. Хендлер коммитит сам (await session.commit()),
+    как только закончил работу с БД, и только потом обращается к Bot API —
+    соединение и блокировки строк не держатся на время запроса к Telegram.
+    Что осталось незакоммиченным, коммитится после хендлера; при ошибке
+    транзакция откатывается при закрытии сессии.
+
+    Хендлерам с флагом profile заранее подгружается профиль пользователя
+    (notifications, query, min_kp_notification), после чего соединение
+    сразу возвращается в пул.
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        async with LocalSession() as session:
+            data["session"] = session
+
+            user = data.get("event_from_user")
+            if get_flag(data, "profile") and user is not None:
+                data["profile"] = await rq.get_profile_by_tg_id(user.id, session=session)
+                await session.commit()
+
+            result = await handler(event, data)
+            await session.commit()
+            return result
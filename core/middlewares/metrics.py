@@ -0,0 +1,31 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from core.metrics import HANDLER_LATENCY
+
+
+def _handler_label(event: TelegramObject) -> str:
+    if isinstance(event, CallbackQuery):
+        return event.data or "callback"
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        return event.text.split(maxsplit=1)[0]
+    return "message"
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Гистограмма времени обработки апдейта по callback_data / команде."""
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_LATENCY.labels(_handler_label(event)).observe(time.perf_counter() - started)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """
+    Обрабатывает каждый update_id один раз на все реплики бота.
+
+    Первая реплика, которой удался SET NX, обрабатывает апдейт. Повторы
+    от Telegram и балансировщика отбрасываются. Если хендлер упал, ключ
+    удаляется, чтобы повторная доставка могла обработать апдейт.
+    """
+
+    def __init__(self, redis: Redis, ttl: int):
+        self.redis = redis
+        self.ttl = ttl
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+
+        key = f"bot:{data['bot'].id}:update:{event.update_id}"
+        if not await self.redis.set(key, 1, nx=True, ex=self.ttl):
+            return None
+        try:
+            return await handler(event, data)
+        except Exception:
+            await self.redis.delete(key)
+            raise
+
+
+class UserOrderMiddleware(BaseMiddleware):
+    """
+    Апдейты одного пользователя обрабатываются по одному и в порядке update_id.
+
+    Каждый апдейт встаёт в общую для всех реплик очередь пользователя —
+    ZSET в Redis со score = update_id — и ждёт, пока станет её головой, то
+    есть пока не обработаны все более ранние апдейты, уже дошедшие до любой
+    реплики. Пока апдейт в очереди, реплика продлевает его ключ-пульс; если
+    голова очереди без пульса (реплика упала), её убирают и очередь идёт дальше.
+
+    Отказы не теряют апдейт: если Redis недоступен или голова не освободилась
+    за timeout секунд, апдейт обрабатывается вне очереди с записью в лог.
+    """
+
+    def __init__(self, redis: Redis, timeout: int, heartbeat: int = 10, poll_interval: float = 0.05):
+        self.redis = redis
+        self.timeout = timeout
+        self.heartbeat = heartbeat
+        self.poll_interval = poll_interval
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        queue = f"bot:{data['bot'].id}:user:{user.id}:queue"
+        ticket = str(event.update_id)
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(queue, {ticket: event.update_id})
+                pipe.expire(queue, self.timeout + self.heartbeat)
+                pipe.set(f"{queue}:{ticket}", 1, ex=self.heartbeat)
+                await pipe.execute()
+        except RedisError:
+            logger.exception("Очередь пользователя %s недоступна, апдейт %s обрабатывается вне очереди",
+                             user.id, ticket)
+            return await handler(event, data)
+
+        pulse = asyncio.create_task(self._pulse(queue, ticket))
+        try:
+            await self._wait_turn(queue, ticket, user.id)
+            return await handler(event, data)
+        finally:
+            pulse.cancel()
+            try:
+                async with self.redis.pipeline(transaction=True) as pipe:
+                    pipe.zrem(queue, ticket)
+                    pipe.delete(f"{queue}:{ticket}")
+                    await pipe.execute()
+            except RedisError:
+                # запись в очереди без пульса уберут ждущие апдейты
+                logger.exception("Не удалось убрать апдейт %s из очереди пользователя %s", ticket, user.id)
+
+    async def _pulse(self, queue: str, ticket: str):
+        while True:
+            await asyncio.sleep(self.heartbeat / 3)
+            try:
+                await self.redis.set(f"{queue}:{ticket}", 1, ex=self.heartbeat)
+            except RedisError:
+                logger.exception("Не удалось продлить апдейт %s в очереди", ticket)
+
+    async def _wait_turn(self, queue: str, ticket: str, user_id: int):
+        deadline = asyncio.get_running_loop().time() + self.timeout
+        try:
+            while True:
+                head = await self.redis.zrange(queue, 0, 0)
+                if not head or head[0].decode() == ticket:
+                    return
+                if not await self.redis.exists(f"{queue}:{head[0].decode()}"):
+                    await self.redis.zrem(queue, head[0])
+                    continue
+                if asyncio.get_running_loop().time() >= deadline:
+                    logger.warning("Апдейт %s пользователя %s не дождался очереди за %s с, обрабатывается вне порядка",
+                                   ticket, user_id, self.timeout)
+                    return
+                await asyncio.sleep(self.poll_interval)
+        except RedisError:
+            logger.exception("Очередь пользователя %s недоступна, апдейт %s обрабатывается вне очереди",
+                             user_id, ticket)
@@ -1,3 +1,7 @@
+import re
+from typing import Literal
+
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -13,4 +17,61 @@ class Settings(BaseSettings):
     PG_URL: str
     PG_URL_ALEMBIC: str
 
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    HANDLER_CONCURRENCY: int = 100
+    WEBHOOK_BASE_URL: str = ""
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+
+    MULTI_REPLICA: bool = False
+    UPDATE_DEDUP_TTL: int = 3600
+    USER_QUEUE_TIMEOUT: int = 30
+
+    NOAA_FORECAST_URL: str = "https://services.swpc.noaa.gov/products/noaa-planetary-k-index-forecast.json"
+    FORECAST_CACHE_TTL: int = 300
+
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_LIMIT_PER_HOST: int = 30
+    HTTP_DNS_TTL: int = 300
+    HTTP_KEEPALIVE_TIMEOUT: int = 30
+
+    TELEGRAM_API_URL: str = "https://api.telegram.org"
+    BROADCAST_RATE: float = 30
+    BROADCAST_WORKERS: int = 20
+    BROADCAST_MAX_RETRIES: int = 3
+    BROADCAST_BATCH_SIZE: int = 500
+    BROADCAST_CHUNK_SIZE: int = 5000
+
+    DELIVERY_WINDOW_MINUTES: int = 60
+    DELIVERY_SLOTS: int = 12
+    BROADCAST_CHECKPOINT_TTL: int = 2 * 24 * 3600
+    BROADCAST_RECOVERY_TTL: int = 6 * 3600
+
+    REDIS_URL: str = "redis://redis:6379/0"
+
+    HEALTH_BUFFER_SIZE: int = 200
+    HEALTH_BUFFER_INTERVAL_MS: int = 500
+    HEALTH_BUFFER_DURABLE: bool = False
+    HEALTH_BUFFER_REDIS_KEY: str = "health:buffer"
+    HEALTH_BUFFER_INSTANCE: str = ""
+
+    KNOWN_USERS_CACHE_SIZE: int = 100_000
+
+    METRICS_PORT: int = 9100
+    METRICS_PUSHGATEWAY_URL: str = ""
+
+    @model_validator(mode="after")
+    def check_webhook(self) -> "Settings":
+        # без секрета любой может слать на WEBHOOK_PATH поддельные апдейты
+        if self.BOT_MODE != "webhook":
+            return self
+        if not self.WEBHOOK_BASE_URL.startswith("https://"):
+            raise ValueError("BOT_MODE=webhook требует WEBHOOK_BASE_URL вида https://...")
+        if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", self.WEBHOOK_SECRET):
+            raise ValueError("BOT_MODE=webhook требует WEBHOOK_SECRET: 1-256 символов A-Z, a-z, 0-9, _ и -")
+        return self
+
 settings = Settings()
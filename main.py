@@ -4,11 +4,68 @@ from aiogram import Bot, Dispatcher
 import logging
 
 from aiogram.client.default import DefaultBotProperties
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from redis.asyncio import Redis
 
 from core.settings import settings
+from core.http_client import http_client
+from core.database.buffer import health_writer
 from core.handlers.all import router
+from core.metrics import start_metrics_server
+from core.middlewares.concurrency import ConcurrencyMiddleware
+from core.middlewares.replicas import UpdateDedupMiddleware, UserOrderMiddleware
 
 
+def build_dispatcher() -> Dispatcher:
+    if not settings.MULTI_REPLICA:
+        dp = Dispatcher(storage=MemoryStorage())
+        dp.update.outer_middleware(ConcurrencyMiddleware(settings.HANDLER_CONCURRENCY))
+        return dp
+
+    # несколько реплик: общее состояние FSM, дедупликация и порядок апдейтов через Redis
+    if settings.BOT_MODE != "webhook":
+        logging.warning("MULTI_REPLICA без webhook: getUpdates может опрашивать только одна реплика")
+    redis = Redis.from_url(settings.REDIS_URL)
+    storage = RedisStorage(redis, key_builder=DefaultKeyBuilder(with_bot_id=True))
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(UpdateDedupMiddleware(redis, settings.UPDATE_DEDUP_TTL))
+    dp.update.outer_middleware(UserOrderMiddleware(redis, settings.USER_QUEUE_TIMEOUT))
+    dp.update.outer_middleware(ConcurrencyMiddleware(settings.HANDLER_CONCURRENCY))
+    return dp
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    # каждая реплика регистрирует один и тот же URL, балансировщик раздаёт апдейты
+    await bot.set_webhook(
+        url=settings.WEBHOOK_BASE_URL.rstrip("/") + settings.WEBHOOK_PATH,
+        secret_token=settings.WEBHOOK_SECRET,
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+    app = web.Application()
+    app.router.add_get("/healthz", healthz)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET,
+    ).register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
 
 async def start():
@@ -17,13 +74,23 @@ async def start():
                                "(%(filename)s).%(funcName)s(%(lineno)d) - %(message)s")
     bot = Bot(token=settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode='Markdown'))
 
-    dp = Dispatcher()
+    dp = build_dispatcher()
 
     dp.include_router(router)
 
+    start_metrics_server()
+    await http_client.start()
+    await health_writer.start()
     try:
-        await dp.start_polling(bot)
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
+        await health_writer.stop()
+        await http_client.close()
+        await dp.storage.close()
         await bot.session.close()
 
 
@@ -2,6 +2,8 @@ import requests
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Tuple
 
+from core.forecast.series import KpSeries, KpSeriesError
+
 
 def get_kp_forecast_report(days_ahead: int = 0) -> Optional[str]:
     """
@@ -19,58 +21,18 @@ def get_kp_forecast_report(days_ahead: int = 0) -> Optional[str]:
     except Exception as e:
         return f"❌ Ошибка загрузки данных: {e}"
 
-    if not data or len(data) < 2:
-        return "❌ Пустой ответ от NOAA."
-
-    headers = data[0]
-    # Гибкий поиск столбцов — на случай переименований
     try:
-        time_col = next(i for i, h in enumerate(headers) if
-                        'time' in h.lower() and ('tag' in h.lower() or h.lower() in {'time', 'timestamp'}))
-        kp_col = next(i for i, h in enumerate(headers) if 'kp' in h.lower())
-        obs_col = next((i for i, h in enumerate(headers) if 'obs' in h.lower() or 'status' in h.lower()), None)
-    except StopIteration:
-        return f"❌ Не найдены столбцы. Заголовки: {headers}"
+        series = KpSeries.parse(data)
+    except KpSeriesError as e:
+        return str(e)
 
     target_date = (datetime.now(timezone.utc).date() + timedelta(days=days_ahead))
-    target_rows: List[Tuple[datetime, float, str]] = []
-
-    for row in data[1:]:
-        if len(row) <= max(time_col, kp_col):
-            continue
-
-        time_str = row[time_col]
-        kp_str = row[kp_col]
-        obs_type = row[obs_col].lower() if obs_col is not None and row[obs_col] else "unknown"
-
-        if not time_str or not kp_str:
-            continue
-
-        try:
-            # Поддерживаем оба формата: "2025-11-21 00:00:00" и "2025-11-21T00:00:00Z"
-            if 'T' in time_str:
-                dt = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-            else:
-                dt = datetime.strptime(time_str.strip(), "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
-        except Exception:
-            continue
-
-        if dt.date() != target_date:
-            continue
-
-        try:
-            kp = float(kp_str)
-        except (ValueError, TypeError):
-            continue
-
-        target_rows.append((dt, kp, obs_type))
+    target_rows: List[Tuple[datetime, float, str]] = series.day_values(target_date)
 
     if not target_rows:
         date_fmt = target_date.strftime("%d.%m.%Y")
         return f"⚠️ Данные за {date_fmt} пока не опубликованы."
 
-    # Сортируем по времени
-    target_rows.sort(key=lambda x: x[0])
     date_str = target_date.strftime("%d.%m.%Y")
 
     lines = [f"🧲 *Геомагнитная обстановка — {date_str}*"]
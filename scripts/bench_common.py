@@ -0,0 +1,44 @@
+"""Общее для бенчмарков: локальные заглушки Telegram Bot API и NOAA, перцентили."""
+import asyncio
+import random
+import statistics
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+
+def telegram_standin(latency: float, rate_429: float, rate_403: float) -> web.Application:
+    async def send_message(request: web.Request) -> web.Response:
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        if random.random() < rate_429:
+            return web.json_response(
+                {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                 "parameters": {"retry_after": 1}},
+                status=429,
+            )
+        if random.Random(payload["chat_id"]).random() < rate_403:
+            return web.json_response(
+                {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                status=403,
+            )
+        return web.json_response({"ok": True, "result": {"message_id": 1, "chat": {"id": payload["chat_id"]}}})
+
+    async def noaa(request: web.Request) -> web.Response:
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = [["time_tag", "kp", "observed", "noaa_scale"]]
+        for i in range(24):
+            slot = start - timedelta(days=1) + timedelta(hours=3 * i)
+            rows.append([slot.strftime("%Y-%m-%d %H:%M:%S"), f"{random.uniform(2, 6):.2f}", "predicted", None])
+        return web.json_response(rows)
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/sendMessage", send_message)
+    app.router.add_get("/noaa", noaa)
+    return app
+
+
+def percentile(samples: list, q: float) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100, method="inclusive")[int(q) - 1]
@@ -0,0 +1,33 @@
+"""Синтетические пользователи, профили и оценки для бенчмарков и проверки планов запросов."""
+import random
+
+from sqlalchemy import insert, text
+
+from core.database.models import Health, Profile, User
+from core.database.session import LocalSession, engine
+
+
+async def seed(users: int, health_per_user: int):
+    """Очищает users/profiles/health и заполняет их заново — только для отдельной базы."""
+    print(f"🌱 Заполняем БД: {users} пользователей, по {health_per_user} оценок")
+    async with LocalSession() as session:
+        await session.execute(text("TRUNCATE health, profiles, users RESTART IDENTITY CASCADE"))
+        batch = 10_000
+        for start in range(1, users + 1, batch):
+            ids = range(start, min(start + batch, users + 1))
+            await session.execute(insert(User), [
+                {"id": i, "user_tg_id": 10_000_000 + i, "username": f"user{i}"} for i in ids
+            ])
+            await session.execute(insert(Profile), [
+                {"user_id": i, "notifications": True, "query": random.random() < 0.8,
+                 "min_kp_notification": random.randint(1, 5), "active": random.random() < 0.95}
+                for i in ids
+            ])
+            await session.execute(insert(Health), [
+                {"user_id": i, "health": random.choice(("good", "normal", "bad")), "kp": random.randint(2, 6)}
+                for i in ids for _ in range(health_per_user)
+            ])
+        await session.execute(text("SELECT setval('users_id_seq', :n)"), {"n": users})
+        await session.commit()
+    async with engine.connect() as conn:
+        await conn.execute(text("ANALYZE users, profiles, health"))